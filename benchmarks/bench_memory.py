@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+bench_memory.py
+~~~~~~~~~~~~~~~
+Report the memory footprint of idle TCP clients on the server side.
+
+For each client count, two fresh child processes are started:
+
+• the server – listens on loopback and, like tcp_server, wraps each
+  accepted socket in a Connection served by a `client_handler` thread
+  created with `threading.stack_size(HANDLER_STACK_SIZE)`;
+• the clients – open the TCP connections and then stay idle, so the
+  server holds exactly one fd per client.
+
+The server reads its RSS (from /proc/self/statm) before accepting, after
+accepting every connection, and again once every handler is blocked
+waiting for its next frame, so the per-client cost is split into "socket"
+and "handler" (Connection + Thread + touched stack). The reserved (virtual)
+memory per client is reported alongside. Kernel socket buffers are not
+part of RSS and are not included.
+
+Both processes raise RLIMIT_NOFILE to what the count needs (the hard limit
+too, where permitted). Nothing is extrapolated: if a limit (fds, threads,
+loopback ports) stops a run early, the row shows how many clients were
+really measured and which limit was hit.
+
+Linux only (needs /proc).
+
+Example
+-------
+$ python benchmarks/bench_memory.py --counts 10000 50000 100000
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import queue
+import resource
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from chat import proto  # noqa: E402
+from chat.connection import Connection  # noqa: E402
+from chat.tcp_server import HANDLER_STACK_SIZE, client_handler  # noqa: E402
+
+FD_MARGIN = 64  # fds left for the interpreter, pipes and stdio
+PORTS_PER_SOURCE = 20_000  # connections per 127.0.0.x source address
+PAGE = os.sysconf("SC_PAGE_SIZE")
+IP_BIND_ADDRESS_NO_PORT = getattr(socket, "IP_BIND_ADDRESS_NO_PORT", 24)  # Linux >= 4.2
+
+
+def memory() -> Tuple[int, int]:
+    """Return (virtual, resident) bytes of this process."""
+    with open("/proc/self/statm") as fh:
+        size, resident = fh.read().split()[:2]
+    return int(size) * PAGE, int(resident) * PAGE
+
+
+def raise_nofile(n: int) -> int:
+    """Raise RLIMIT_NOFILE to fit `n` sockets; return the usable socket count."""
+    need = n + FD_MARGIN
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < need:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (need, max(hard, need)))
+        except (ValueError, OSError):
+            if hard == resource.RLIM_INFINITY or hard >= need:
+                resource.setrlimit(resource.RLIMIT_NOFILE, (need, hard))
+            else:
+                resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        soft = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+    return soft - FD_MARGIN
+
+
+def parked(threads: List[threading.Thread]) -> int:
+    """Count handler threads blocked waiting for their next frame."""
+    frames = sys._current_frames()
+    wait = proto._wait_header.__code__
+    n = 0
+    for t in threads:
+        frame = frames.get(t.ident)
+        if frame is not None and frame.f_code is wait:
+            n += 1
+    return n
+
+
+# ---------- Client process ---------- #
+def run_peers(
+    n: int,
+    addr: Tuple[str, int],
+    status: "multiprocessing.Queue",
+    done: "multiprocessing.Event",
+) -> None:
+    """Open up to `n` idle connections to `addr`; hold them until `done`."""
+    limit = raise_nofile(n)
+    socks: List[socket.socket] = []
+    error: Optional[str] = None
+    if limit < n:
+        error = f"client RLIMIT_NOFILE allows {limit}"
+    try:
+        for i in range(min(n, limit)):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            socks.append(sock)
+            # pick the port at connect(), per 4-tuple, not per source address
+            sock.setsockopt(socket.IPPROTO_IP, IP_BIND_ADDRESS_NO_PORT, 1)
+            # spread over 127.0.0.x so one source address never runs out of ports
+            sock.bind((f"127.0.0.{1 + i // PORTS_PER_SOURCE}", 0))
+            sock.connect(addr)
+    except OSError as exc:
+        socks.pop().close()
+        error = f"client connect failed after {len(socks)}: {exc}"
+    status.put((len(socks), error))
+    done.wait()
+    for sock in socks:
+        sock.close()
+
+
+# ---------- Server process ---------- #
+def run_server(n: int, results: "multiprocessing.Queue") -> None:
+    """Accept up to `n` clients, serve each from a handler thread, measure."""
+    threading.stack_size(HANDLER_STACK_SIZE)
+    limit = raise_nofile(n)
+    base_virt, base_rss = memory()
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(4096)
+    listener.settimeout(1.0)
+
+    ctx = multiprocessing.get_context("spawn")
+    status, done = ctx.Queue(), ctx.Event()
+    peers = ctx.Process(target=run_peers, args=(n, listener.getsockname(), status, done))
+    peers.start()
+
+    notes: List[str] = []
+    if limit < n:
+        notes.append(f"server RLIMIT_NOFILE allows {limit}")
+    accepted: List[Tuple[socket.socket, Tuple[str, int]]] = []
+    connected: Optional[int] = None  # set once the client process is done
+    while len(accepted) < min(n, limit) and (connected is None or len(accepted) < connected):
+        try:
+            accepted.append(listener.accept())
+        except socket.timeout:
+            with contextlib.suppress(queue.Empty):
+                connected, error = status.get_nowait()
+                if error:
+                    notes.append(error)
+            continue
+        except OSError as exc:
+            notes.append(f"accept failed after {len(accepted)}: {exc}")
+            break
+    if connected is None:
+        connected, error = status.get()
+        if error:
+            notes.append(error)
+    _, sock_rss = memory()
+
+    conns: List[Connection] = []
+    threads: List[threading.Thread] = []
+    with contextlib.redirect_stdout(io.StringIO()):  # handlers log connects
+        for i, (sock, addr) in enumerate(accepted):
+            conn = Connection(sock, addr, i)
+            conns.append(conn)
+            t = threading.Thread(target=client_handler, args=(conn,), daemon=True)
+            try:
+                t.start()
+            except RuntimeError as exc:  # thread / pid limit
+                notes.append(f"started {len(threads)} handler threads: {exc}")
+                conn.close()
+                break
+            threads.append(t)
+        deadline = time.monotonic() + 120
+        while parked(threads) < len(threads) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        waiting = parked(threads)
+        virt, rss = memory()
+
+        # tear down: the clients disconnect, the handlers see EOF and exit
+        done.set()
+        peers.join()
+        for t in threads:
+            t.join()
+        for sock, _ in accepted[len(conns):]:
+            sock.close()
+    listener.close()
+
+    results.put({
+        "clients": len(threads),
+        "parked": waiting,
+        "socket": sock_rss - base_rss,
+        "socket_count": len(accepted),
+        "handler": rss - sock_rss,
+        "virtual": virt - base_virt,
+        "notes": "; ".join(notes),
+    })
+
+
+def measure(n: int) -> Dict:
+    """Run one count in fresh processes so earlier counts cannot skew RSS."""
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    server = ctx.Process(target=run_server, args=(n, results))
+    server.start()
+    result = results.get()
+    server.join()
+    return result
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Bytes per idle CLI-Chat client")
+    ap.add_argument("--counts", type=int, nargs="+", default=[10_000, 50_000, 100_000],
+                    help="client counts to measure")
+    args = ap.parse_args()
+
+    print(f"{'clients':>8}  {'parked':>7}  {'socket B':>8}  {'handler B':>9}  "
+          f"{'RSS B/client':>12}  {'total MiB':>9}  {'virt KiB':>8}")
+    for n in args.counts:
+        r = measure(n)
+        m = r["clients"]
+        if not m:
+            print(f"{n:>8}  not measured: {r['notes']}")
+            continue
+        sock = r["socket"] / max(r["socket_count"], 1)
+        handler = r["handler"] / m
+        print(f"{m:>8}  {r['parked']:>7}  {sock:>8.0f}  {handler:>9.0f}  "
+              f"{sock + handler:>12.0f}  {(r['socket'] + r['handler']) / 2**20:>9.1f}  "
+              f"{r['virtual'] / m / 1024:>8.0f}")
+        if m < n:
+            print(f"{'':>10}stopped at {m} of {n} clients: {r['notes']}")
+
+    print(f"\nhandler stack reserved per thread: {HANDLER_STACK_SIZE >> 10} KiB "
+          f"(virtual; only touched pages count towards RSS)")
+    print("kernel socket buffers are not included")
+
+
+if __name__ == "__main__":
+    main()
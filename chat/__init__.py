@@ -15,6 +15,12 @@ __all__ = [
     "udp_server",
     "link_monitor",
     "proto",
+    "gateway",
+    "capture",
+    "replay",
+    "scheduler",
+    "connection",
+    "profiling",
 ]
 
 try:
@@ -3,13 +3,15 @@
 python -m chat
 ==============
 
-A thin convenience launcher that delegates to one of four
+A thin convenience launcher that delegates to one of the
 concrete entry-points:
 
     • tcp-client   → chat.tcp_client.main()
     • tcp-server   → chat.tcp_server.main()
     • udp-client   → chat.udp_client.main()
     • udp-server   → chat.udp_server.main()
+    • gateway      → chat.gateway.main()
+    • replay       → chat.replay.main()
 
 Example
 -------
@@ -29,6 +31,8 @@ COMMAND_MAP = {
     "tcp-server": "tcp_server",
     "udp-client": "udp_client",
     "udp-server": "udp_server",
+    "gateway": "gateway",
+    "replay": "replay",
 }
 
 
@@ -45,6 +49,8 @@ def _usage(exit_code: int = 0) -> None:
               tcp-server   Start the multithreaded TCP echo server
               udp-client   Simple standalone UDP echo client
               udp-server   Simple UDP echo server
+              gateway      Multiplex many clients over a few upstream links
+              replay       Play a --capture file back against a server
 
             Try:
               {executable} tcp-client --help
@@ -0,0 +1,105 @@
+"""
+capture.py
+----------
+Compact binary traffic capture for CLI-Chat servers.
+
+File layout ⇒ 8-byte MAGIC, then one record per inbound frame:
+
+TIME : 8-byte float, seconds since the epoch (big-endian double)
+CONN : 4-byte connection ID assigned by the server (big-endian)
+FRAME: the frame itself in proto framing (1-byte TAG + 2-byte LEN + BODY)
+
+Captures are written by `tcp_server --capture` / `udp_server --capture`
+and played back by `python -m chat replay`. Each record reaches the file
+with a single unbuffered write, so a capture can be replayed while the
+server is still running, and one cut short by a kill or crash loses at
+most its last, partial record (the reader stops there with a warning).
+"""
+
+from __future__ import annotations
+import struct
+import threading
+import time
+from typing import Iterator, List, Optional, Tuple
+
+from chat import proto  # chat/proto.py
+
+MAGIC = b"CHATCAP1"
+_RECORD_FMT = "!dI"  # 8-byte timestamp + 4-byte connection id
+_RECORD_SIZE = struct.calcsize(_RECORD_FMT)  # = 12 bytes
+
+Record = Tuple[float, int, bytes, bytes]  # (timestamp, conn_id, tag, body)
+
+
+class CaptureWriter:
+    """
+    Append inbound frames to a capture file (thread-safe, unbuffered).
+
+    Parameters
+    ----------
+    path : str
+        Output file; truncated if it already exists.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        self._lock = threading.Lock()
+        self._fh = open(path, "wb", buffering=0)
+        self._fh.write(MAGIC)
+
+    def record(self, conn_id: int, tag: bytes, body: bytes, ts: Optional[float] = None) -> None:
+        """
+        Append one frame received on connection `conn_id`.
+
+        `ts` is the arrival time (time.time()); defaults to now. Pass it when
+        the frame is recorded later than it arrived, e.g. from a worker thread.
+        """
+        if ts is None:
+            ts = time.time()
+        record = struct.pack(_RECORD_FMT, ts, conn_id) + proto.encode(body, tag=tag)
+        with self._lock:
+            if self._fh.closed:
+                return
+            self._fh.write(record)
+            self.count += 1
+
+    def close(self) -> None:
+        with self._lock:
+            self._fh.close()
+
+
+def read_capture(path: str) -> Iterator[Record]:
+    """
+    Yield (timestamp, conn_id, tag, body) for every record in a capture file.
+
+    A truncated last record (a server killed mid-write, or one still
+    writing) is skipped with a warning; everything before it is yielded.
+
+    Raises
+    ------
+    ValueError
+        If the file does not start with MAGIC.
+    """
+    with open(path, "rb") as fh:
+        if fh.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path}: not a CLI-Chat capture file")
+        buffer = fh.read()
+
+    view = memoryview(buffer)
+    while view:
+        try:
+            if len(view) < _RECORD_SIZE:
+                raise ValueError("truncated record header")
+            ts, conn_id = struct.unpack_from(_RECORD_FMT, view)
+            tag, body, view = proto.decode(view[_RECORD_SIZE:])
+        except ValueError as exc:
+            offset = len(MAGIC) + len(buffer) - len(view)
+            print(f"[CAPTURE] {path}: {exc} at byte {offset} – ignoring the rest")
+            return
+        yield ts, conn_id, tag, bytes(body)
+
+
+def load_capture(path: str) -> List[Record]:
+    """Read a whole capture file, sorted by timestamp."""
+    return sorted(read_capture(path), key=lambda rec: rec[0])
@@ -0,0 +1,73 @@
+"""
+connection.py
+-------------
+Compact per-connection state shared by tcp_server and gateway.
+
+One `Connection` exists per accepted TCP client. It is a slotted record
+(no per-instance __dict__) holding only what the handler needs; the
+outbound SendScheduler runs in writer mode, so the handler thread keeps
+reading while replies wait and ping replies can overtake a backlog. The
+backlog is bounded in bytes (MAX_PENDING_BYTES): a client that sends but
+never reads blocks its handler, just as a plain `sendall` would. Its
+queues and writer thread exist only while there is something to send, and
+receive buffers are borrowed from a shared proto.BufferPool only while a
+frame is in flight. See benchmarks/bench_memory.py for the footprint.
+"""
+
+from __future__ import annotations
+import socket
+from typing import Optional, Tuple
+
+from chat import proto  # chat/proto.py
+from .scheduler import SendScheduler
+
+MAX_PENDING_BYTES = 256 << 10  # queued reply bytes per connection before submit() blocks
+
+
+class Connection:
+    """
+    State for one connected TCP client.
+
+    Parameters
+    ----------
+    sock : socket.socket
+        The accepted client socket.
+    addr : Tuple[str, int]
+        The client's address.
+    conn_id : int, default=0
+        Server-assigned connection (or gateway stream) ID.
+    pool : proto.BufferPool, optional
+        Receive buffer pool. Defaults to proto.DEFAULT_POOL.
+    max_pending_bytes : int, default=MAX_PENDING_BYTES
+        Outbound queue bound in bytes (see SendScheduler).
+    """
+
+    __slots__ = ("sock", "addr", "conn_id", "out", "pool")
+
+    def __init__(
+        self,
+        sock: socket.socket,
+        addr: Tuple[str, int],
+        conn_id: int = 0,
+        pool: Optional[proto.BufferPool] = None,
+        max_pending_bytes: int = MAX_PENDING_BYTES,
+    ):
+        self.sock = sock
+        self.addr = addr
+        self.conn_id = conn_id
+        self.out = SendScheduler(sock, writer=True, max_pending_bytes=max_pending_bytes)
+        self.pool = pool or proto.DEFAULT_POOL
+
+    def recv_packet(self) -> Tuple[bytes, bytes]:
+        """Receive one (tag, body) frame using a pooled buffer."""
+        return proto.recv_packet_tcp(self.sock, self.pool)
+
+    def close(self) -> None:
+        self.out.close()
+        try:
+            self.sock.close()
+        except Exception:
+            pass
+
+    def __repr__(self) -> str:
+        return f"Connection(#{self.conn_id} {self.addr})"
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+gateway.py
+~~~~~~~~~~
+Connection-multiplexing gateway for CLI-Chat.
+
+Edge clients connect to the gateway exactly as they would to tcp_server.
+The gateway keeps a small pool of upstream TCP links to the core server and
+forwards every client frame over one of them, wrapped in a b'M' frame that
+carries the client's stream ID (see proto.encode_mux). Replies are routed
+back to the right client by the same ID.
+
+Health checks
+-------------
+• Client pings (b"__ping__") are answered by the gateway itself, but only
+  while the client's upstream link is healthy – otherwise they go
+  unanswered so the client's LinkMonitor fails over as usual.
+• Each upstream link is pinged once per interval, shared by all of its
+  clients, so the core server sees one ping stream per link instead of one
+  per client.
+• All writes (upstream and to clients) go through a SendScheduler, so
+  pings and pongs are never stuck behind a chat or file backlog.
+• Each upstream link has its own writer and a byte-bounded queue: when the
+  core link is slower than the clients, forwarding blocks the client
+  handlers (and so the clients), instead of growing the queue in gateway
+  memory or making one client's thread send everybody's frames.
+• Each client has a bounded outbound queue, drained by its own writer
+  thread once a backlog forms. The upstream reader never blocks on a
+  client: a client whose queue overflows (it stopped reading) is
+  disconnected on its own.
+• Client threads get tcp_server's reduced stack (HANDLER_STACK_SIZE), so
+  the connections moved off the core stay cheap here too.
+• Client frames too large for a mux frame (> proto.MAX_MUX_BODY) are
+  rejected with an error reply to the client.
+
+Example
+-------
+$ python -m chat gateway --port 9100 --server-host 10.0.0.5 --upstreams 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import socket
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from chat import proto  # chat/proto.py
+from .connection import Connection
+from .scheduler import CONTROL, SendQueueFull, SendScheduler
+from .tcp_server import HANDLER_STACK_SIZE
+
+# --------------------------------------------------------------------------- #
+PING_BODY = b"__ping__"
+TAG_TCP = b"T"
+CLIENT_MAX_PENDING_BYTES = 256 << 10  # reply bytes queued per client before it counts as stalled
+UPSTREAM_MAX_PENDING_BYTES = 1 << 20  # bytes queued per upstream link before clients block
+
+
+class Upstream:
+    """
+    One TCP link to the core server, shared by many client streams.
+
+    Parameters
+    ----------
+    server_addr : Tuple[str, int]
+        Address of the core tcp_server.
+    index : int
+        Position in the gateway's upstream pool (for log messages).
+    interval : float, default=3.0
+        Ping interval in seconds.
+    timeout : float, default=1.0
+        Pong wait timeout in seconds.
+    fail_threshold : int, default=3
+        Consecutive missed pongs before the link is considered dead.
+    """
+
+    def __init__(
+        self,
+        server_addr: Tuple[str, int],
+        index: int,
+        *,
+        interval: float = 3.0,
+        timeout: float = 1.0,
+        fail_threshold: int = 3,
+    ):
+        self.server_addr = server_addr
+        self.index = index
+        self.interval = interval
+        self.timeout = timeout
+        self.fail_threshold = fail_threshold
+
+        self.sock: Optional[socket.socket] = None
+        self.out: Optional[SendScheduler] = None
+        self.alive = threading.Event()
+        self.streams: Dict[int, Connection] = {}  # stream_id -> client
+
+        self._streams_lock = threading.Lock()
+        self._link_lock = threading.Lock()  # guards sock/out replacement and teardown
+        self._pong = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+
+    # ---------- Stream bookkeeping ---------- #
+    def attach(self, conn: Connection) -> None:
+        with self._streams_lock:
+            self.streams[conn.conn_id] = conn
+
+    def detach(self, conn: Connection) -> None:
+        with self._streams_lock:
+            self.streams.pop(conn.conn_id, None)
+
+    def load(self) -> int:
+        return len(self.streams)
+
+    # ---------- I/O ---------- #
+    def send(self, packet: bytes, priority: Optional[int] = None) -> None:
+        """Send one already-framed packet upstream (thread-safe)."""
+        out = self.out
+        if out is None:
+            raise ConnectionError("upstream not connected")
+        out.submit(packet, priority)
+
+    def _connect(self) -> bool:
+        try:
+            sock = socket.create_connection(self.server_addr, timeout=self.timeout)
+        except OSError:
+            return False
+        sock.settimeout(None)
+        with self._link_lock:
+            self.out = SendScheduler(
+                sock, writer=True, max_pending_bytes=UPSTREAM_MAX_PENDING_BYTES
+            )
+            self.sock = sock
+            self.alive.set()
+        threading.Thread(target=self._reader, args=(sock,), daemon=True).start()
+        print(f"[GATEWAY] upstream #{self.index} connected to {self.server_addr}")
+        return True
+
+    def _drop(self, sock: socket.socket) -> None:
+        """
+        Mark the link dead and disconnect every client riding on it.
+
+        Called from both the reader thread and the ping loop; only the first
+        caller for a given socket tears it down.
+        """
+        with self._link_lock:
+            if self.sock is not sock:
+                return  # already dropped or replaced
+            self.alive.clear()
+            out, self.sock, self.out = self.out, None, None
+            if out is not None:
+                out.close()  # wake client handlers blocked on a full queue
+            try:
+                sock.shutdown(socket.SHUT_RDWR)  # wake the reader thread
+                sock.close()
+            except Exception:
+                pass
+        with self._streams_lock:
+            orphans = list(self.streams.values())
+            self.streams.clear()
+        for conn in orphans:
+            try:
+                conn.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        print(f"[GATEWAY] upstream #{self.index} lost ({len(orphans)} clients dropped)")
+
+    def _reader(self, sock: socket.socket) -> None:
+        """Route frames coming back from the core server."""
+        try:
+            while True:
+                tag, body = proto.recv_packet_tcp(sock)
+                if tag != proto.TAG_MUX:
+                    if body == PING_BODY:
+                        self._pong.set()
+                    continue
+                try:
+                    stream_id, inner_tag, inner_body = proto.decode_mux(body)
+                except ValueError:
+                    continue
+                conn = self.streams.get(stream_id)
+                if conn is None:
+                    continue  # client already gone
+                try:
+                    conn.out.submit(proto.encode(inner_body, tag=inner_tag), block=False)
+                except SendQueueFull:
+                    self._drop_slow_client(conn)
+                except OSError:
+                    pass
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self._drop(sock)
+
+    def _drop_slow_client(self, conn: Connection) -> None:
+        """Disconnect a client that stopped reading; its handler cleans up."""
+        print(f"[GATEWAY] client {conn.addr} (stream {conn.conn_id}) not reading – disconnecting")
+        self.detach(conn)
+        try:
+            conn.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    # ---------- Health-check loop ---------- #
+    def run(self) -> None:
+        fail_cnt = 0
+        while self._running.is_set():
+            start = time.perf_counter()
+            sock = self.sock
+            if sock is None:
+                self._connect()
+                fail_cnt = 0
+            else:
+                self._pong.clear()
+                try:
+                    self.send(proto.encode(PING_BODY, tag=TAG_TCP), CONTROL)
+                    ok = self._pong.wait(self.timeout)
+                except OSError:
+                    ok = False
+                fail_cnt = 0 if ok else fail_cnt + 1
+                if fail_cnt >= self.fail_threshold:
+                    self._drop(sock)
+                    fail_cnt = 0
+            elapsed = time.perf_counter() - start
+            if elapsed < self.interval:
+                time.sleep(self.interval - elapsed)
+
+    def start(self) -> None:
+        self._connect()
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def stop(self) -> None:
+        self._running.clear()
+        sock = self.sock
+        if sock is not None:
+            self._drop(sock)
+
+
+class Gateway:
+    """
+    Accept client connections and spread them over a pool of upstreams.
+    """
+
+    def __init__(self, upstreams: List[Upstream]):
+        self.upstreams = upstreams
+        self._ids = itertools.count(1)
+
+    def pick_upstream(self) -> Optional[Upstream]:
+        """Return the healthy upstream with the fewest streams, if any."""
+        healthy = [u for u in self.upstreams if u.alive.is_set()]
+        if not healthy:
+            return None
+        return min(healthy, key=Upstream.load)
+
+    def client_handler(self, sock: socket.socket, addr: Tuple[str, int]) -> None:
+        """Forward one client's frames upstream until it disconnects."""
+        upstream = self.pick_upstream()
+        if upstream is None:
+            print(f"[GATEWAY] no healthy upstream – refusing {addr}")
+            sock.close()
+            return
+
+        stream_id = next(self._ids) & 0xFFFFFFFF
+        conn = Connection(sock, addr, stream_id, max_pending_bytes=CLIENT_MAX_PENDING_BYTES)
+        upstream.attach(conn)
+        print(f"[GATEWAY] client {addr} -> stream {stream_id} on upstream #{upstream.index}")
+
+        try:
+            while True:
+                try:
+                    tag, body = conn.recv_packet()
+                except (ConnectionError, OSError):
+                    break
+                except ValueError:
+                    continue
+
+                # Answer health checks locally while the shared link is up
+                if body == PING_BODY:
+                    if upstream.alive.is_set():
+                        try:
+                            conn.out.submit(proto.encode(PING_BODY, tag=TAG_TCP), CONTROL)
+                        except OSError:
+                            break
+                    continue
+
+                if len(body) > proto.MAX_MUX_BODY:
+                    msg = f"frame too large for gateway: {len(body)} > {proto.MAX_MUX_BODY} bytes"
+                    print(f"[GATEWAY] client {addr} (stream {stream_id}): {msg}")
+                    try:
+                        conn.out.submit(proto.encode(f"[GATEWAY] {msg}", tag=TAG_TCP))
+                    except OSError:
+                        break
+                    continue
+
+                try:
+                    upstream.send(proto.encode_mux(stream_id, body, tag=tag))
+                except (ConnectionError, OSError):
+                    break
+        finally:
+            upstream.detach(conn)
+            print(f"[GATEWAY] client {addr} (stream {stream_id}) disconnected")
+            conn.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="CLI-Chat connection-multiplexing gateway")
+    parser.add_argument("--host", default="0.0.0.0", help="bind address for clients")
+    parser.add_argument("--port", type=int, default=9100, help="TCP port for clients")
+    parser.add_argument("--server-host", default="127.0.0.1", help="core server address")
+    parser.add_argument("--server-port", type=int, default=9000, help="core server TCP port")
+    parser.add_argument("--upstreams", type=int, default=4, help="number of upstream links")
+    parser.add_argument("--interval", type=float, default=3.0, help="upstream ping interval (s)")
+    parser.add_argument("--timeout", type=float, default=1.0, help="upstream pong timeout (s)")
+    args = parser.parse_args()
+
+    # One handler (plus, under load, a writer) thread per client: keep stacks small
+    threading.stack_size(HANDLER_STACK_SIZE)
+
+    server_addr = (args.server_host, args.server_port)
+    upstreams = [
+        Upstream(server_addr, i, interval=args.interval, timeout=args.timeout)
+        for i in range(args.upstreams)
+    ]
+    for upstream in upstreams:
+        upstream.start()
+    gateway = Gateway(upstreams)
+
+    serv_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    serv_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    serv_sock.bind((args.host, args.port))
+    serv_sock.listen()
+
+    print(
+        f"[GATEWAY] Listening on {args.host}:{args.port} -> "
+        f"{args.server_host}:{args.server_port} x{args.upstreams} (Ctrl-C to quit)"
+    )
+
+    try:
+        while True:
+            client_sock, client_addr = serv_sock.accept()
+            t = threading.Thread(
+                target=gateway.client_handler, args=(client_sock, client_addr), daemon=True
+            )
+            t.start()
+    except KeyboardInterrupt:
+        print("\n[GATEWAY] Shutting down…")
+    finally:
+        for upstream in upstreams:
+            upstream.stop()
+        serv_sock.close()
+
+
+if __name__ == "__main__":
+    main()
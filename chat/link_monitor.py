@@ -14,6 +14,9 @@ External API:
     - self.active       : "tcp" | "udp" (currently active channel)
     - self.stop()       : Stop the monitor thread
     - on_switch_cb      : Optional callback invoked on channel switch
+    - scheduler         : Optional SendScheduler shared with the TCP chat
+                          traffic; pings are submitted as CONTROL so they
+                          never wait behind queued data
 
 Usage example:
 -------
@@ -31,6 +34,7 @@ import socket
 from typing import Callable, Optional, Tuple
 
 from chat import proto  # chat/proto.py
+from .scheduler import CONTROL, SendScheduler
 
 PING = b"__ping__"
 TAG_TCP = b"T"
@@ -57,6 +61,8 @@ class LinkMonitor(threading.Thread):
         Consecutive failures before switching channel.
     on_switch_cb : Callable[[str], None], optional
         Callback invoked with new channel name when switching.
+    scheduler : SendScheduler, optional
+        Outbound queue of `tcp_sock`; if given, TCP pings go through it.
     """
 
     def __init__(
@@ -69,6 +75,7 @@ class LinkMonitor(threading.Thread):
         timeout: float = 1.0,
         fail_threshold: int = 3,
         on_switch_cb: Optional[Callable[[str], None]] = None,
+        scheduler: Optional[SendScheduler] = None,
     ):
         super().__init__(daemon=True)
         self.tcp_sock = tcp_sock
@@ -79,6 +86,7 @@ class LinkMonitor(threading.Thread):
         self.timeout = timeout
         self.fail_threshold = fail_threshold
         self.on_switch_cb = on_switch_cb
+        self.scheduler = scheduler
 
         self.active: str = "tcp"   # currently active channel
         self._running = threading.Event()
@@ -87,7 +95,10 @@ class LinkMonitor(threading.Thread):
     # ---------- Internal helpers ---------- #
     def _send_ping_tcp(self) -> None:
         pkt = proto.encode(PING, tag=TAG_TCP)
-        self.tcp_sock.sendall(pkt)
+        if self.scheduler is not None:
+            self.scheduler.submit(pkt, CONTROL)
+        else:
+            self.tcp_sock.sendall(pkt)
         self.tcp_sock.settimeout(self.timeout)
         proto.recv_packet_tcp(self.tcp_sock)  # receive & verify reply
 
@@ -0,0 +1,273 @@
+"""
+profiling.py
+------------
+Built-in, low-overhead profiling for the CLI-Chat servers and client.
+
+Enabled with `--profile FILE` on tcp_server, udp_server and tcp_client:
+
+• A sampler thread snapshots the Python stacks of busy threads and writes
+  collapsed stacks to FILE on shutdown – one "frame;frame;frame count" line
+  per stack, ready for flamegraph.pl / speedscope. Stacks are rooted at the
+  thread's target function, so all client handlers merge into one tree.
+  Threads parked in an idle wait (a connection waiting for its next frame,
+  accept, Condition/Event waits, select, or any function marked with
+  `@idle_wait`) are counted but not walked. The
+  interval stretches so sampling takes at most SAMPLE_BUDGET of wall time,
+  however many threads there are.
+• Timing spans around the hot-path stages accumulate per-stage call counts
+  and time. Every frame passes through each stage once, so the call counts
+  line up:
+    receive – socket reads after the first bytes of a TCP frame arrived
+              (plus the LEN field they need), not idle waiting
+    decode  – interpreting the frame (datagram parse, gateway mux unwrap)
+    handle  – capture + logging / dispatch
+    encode  – building the reply frame
+    send    – handing it to the SendScheduler
+  A UDP datagram arrives in the same call that waits for it, so udp_server
+  reports no receive stage; tcp_client reads its TCP stream in chunks, so
+  there a receive call may carry several frames or part of one.
+  Each thread adds to its own totals without taking a lock; they are
+  merged for the summary (and folded in when the thread exits).
+• A per-stage summary is printed on shutdown.
+
+When profiling is off, `span()` returns a shared no-op context manager.
+
+Usage example:
+-------
+>>> profiling.enable("tcp_server.folded")
+>>> with profiling.span("encode"):
+...     packet = proto.encode(body)
+>>> profiling.shutdown()
+"""
+
+from __future__ import annotations
+import collections
+import os
+import sys
+import threading
+import time
+import weakref
+from contextlib import nullcontext
+from typing import Counter, Dict, List, Optional, Tuple
+
+STAGES = ("receive", "decode", "handle", "encode", "send")
+DEFAULT_INTERVAL = 0.005  # seconds between stack samples
+SAMPLE_BUDGET = 0.05  # max share of wall time (and GIL) spent sampling
+IDLE_WAITS = {  # "file:function" leaf frames the sampler skips; see idle_wait()
+    "socket.py:accept",
+    "threading.py:wait",  # Condition / Event waits
+    "selectors.py:select",
+}
+_NULL_SPAN = nullcontext()
+
+
+class _Span:
+    """Times one `with` block into the profiler's per-stage totals."""
+
+    __slots__ = ("profiler", "stage", "start")
+
+    def __init__(self, profiler: "Profiler", stage: str):
+        self.profiler = profiler
+        self.stage = stage
+        self.start = 0.0
+
+    def __enter__(self) -> "_Span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.profiler.add(self.stage, time.perf_counter() - self.start)
+
+
+class _ThreadTotals:
+    """One thread's per-stage totals; folded into the profiler when the thread ends."""
+
+    __slots__ = ("profiler", "count", "time", "__weakref__")
+
+    def __init__(self, profiler: "Profiler"):
+        self.profiler = profiler
+        self.count: Dict[str, int] = dict.fromkeys(STAGES, 0)
+        self.time: Dict[str, float] = dict.fromkeys(STAGES, 0.0)
+
+    def __del__(self) -> None:
+        self.profiler._retire(self)
+
+
+class Profiler(threading.Thread):
+    """
+    Sampling profiler plus per-stage timing.
+
+    Parameters
+    ----------
+    path : str
+        Where to write collapsed stacks on `stop()`.
+    interval : float, default=0.005
+        Minimum seconds between stack samples; stretched to keep sampling
+        within SAMPLE_BUDGET.
+    """
+
+    def __init__(self, path: str, *, interval: float = DEFAULT_INTERVAL):
+        super().__init__(daemon=True, name="profiler")
+        self.path = path
+        self.interval = interval
+        self.samples: Counter[str] = collections.Counter()
+        self.idle = 0  # thread samples skipped as idle waits
+        self._labels: Dict[object, str] = {}  # code object -> "file:function"
+        self._retired_count: Dict[str, int] = dict.fromkeys(STAGES, 0)
+        self._retired_time: Dict[str, float] = dict.fromkeys(STAGES, 0.0)
+        self._threads: "weakref.WeakSet[_ThreadTotals]" = weakref.WeakSet()
+        self._local = threading.local()
+        self._lock = threading.RLock()  # guards the retired totals and _threads
+        self._running = threading.Event()
+        self._running.set()
+
+    # ---------- Timing spans ---------- #
+    def span(self, stage: str) -> _Span:
+        return _Span(self, stage)
+
+    def add(self, stage: str, seconds: float) -> None:
+        try:
+            totals = self._local.totals
+        except AttributeError:
+            totals = self._local.totals = _ThreadTotals(self)
+            with self._lock:
+                self._threads.add(totals)
+        # only this thread writes these dicts, so no lock is needed
+        totals.count[stage] = totals.count.get(stage, 0) + 1
+        totals.time[stage] = totals.time.get(stage, 0.0) + seconds
+
+    def _retire(self, totals: _ThreadTotals) -> None:
+        with self._lock:
+            for stage, count in totals.count.items():
+                self._retired_count[stage] = self._retired_count.get(stage, 0) + count
+            for stage, seconds in totals.time.items():
+                self._retired_time[stage] = self._retired_time.get(stage, 0.0) + seconds
+
+    def totals(self) -> Tuple[Dict[str, int], Dict[str, float]]:
+        """Per-stage (call counts, seconds), merged over all threads."""
+        with self._lock:
+            count = dict(self._retired_count)
+            seconds = dict(self._retired_time)
+            live = list(self._threads)
+        for t in live:
+            for stage, n in dict(t.count).items():
+                count[stage] = count.get(stage, 0) + n
+            for stage, dt in dict(t.time).items():
+                seconds[stage] = seconds.get(stage, 0.0) + dt
+        return count, seconds
+
+    @property
+    def stage_count(self) -> Dict[str, int]:
+        return self.totals()[0]
+
+    @property
+    def stage_time(self) -> Dict[str, float]:
+        return self.totals()[1]
+
+    # ---------- Sampler ---------- #
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{os.path.basename(code.co_filename)}:{code.co_name}"
+            self._labels[code] = label
+        return label
+
+    def _sample(self) -> None:
+        me = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            if self._label(frame.f_code) in IDLE_WAITS:
+                self.idle += 1
+                continue
+            stack: List[str] = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            # root at the thread's target: drop threading.py bootstrap frames
+            while len(stack) > 1 and stack[-1].startswith("threading.py:"):
+                stack.pop()
+            self.samples[";".join(reversed(stack))] += 1
+
+    def run(self) -> None:
+        while self._running.is_set():
+            start = time.perf_counter()
+            self._sample()
+            cost = time.perf_counter() - start
+            time.sleep(max(self.interval, cost / SAMPLE_BUDGET))
+
+    # ---------- Output ---------- #
+    def write_collapsed(self) -> None:
+        with open(self.path, "w") as fh:
+            for stack, count in self.samples.most_common():
+                fh.write(f"{stack} {count}\n")
+
+    def summary(self) -> str:
+        """Per-stage totals plus the hottest leaf functions."""
+        count, seconds = self.totals()
+        rows = [(s, count[s], seconds.get(s, 0.0)) for s in count]
+        total = sum(t for _, _, t in rows) or 1.0
+        lines = [f"  {'stage':<8} {'calls':>9} {'total ms':>10} {'mean µs':>9} {'share':>7}"]
+        for stage, count, seconds in rows:
+            mean = seconds / count * 1e6 if count else 0.0
+            lines.append(
+                f"  {stage:<8} {count:>9} {seconds * 1e3:>10.2f} {mean:>9.1f} "
+                f"{seconds / total * 100:>6.1f}%"
+            )
+
+        leaves: Counter[str] = collections.Counter()
+        for stack, count in self.samples.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        n_samples = sum(leaves.values()) or 1
+        lines.append(f"  hottest frames ({n_samples} samples, {self.idle} idle waits skipped):")
+        for frame, count in leaves.most_common(5):
+            lines.append(f"    {count / n_samples * 100:5.1f}%  {frame}")
+        return "\n".join(lines)
+
+    def stop(self) -> None:
+        self._running.clear()
+        self.join()
+        self.write_collapsed()
+
+
+# ---------- Module-level switch ---------- #
+_active: Optional[Profiler] = None
+
+
+def enable(path: str, interval: float = DEFAULT_INTERVAL) -> Profiler:
+    """Start the process-wide profiler, writing collapsed stacks to `path`."""
+    global _active
+    _active = Profiler(path, interval=interval)
+    _active.start()
+    return _active
+
+
+def idle_wait(func):
+    """
+    Mark `func` as an idle wait (a blocking call wrapper such as a recv).
+
+    Threads whose innermost Python frame is `func` are skipped by the
+    sampler instead of filling the profile with time spent waiting.
+    """
+    code = func.__code__
+    IDLE_WAITS.add(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+    return func
+
+
+def span(stage: str):
+    """Context manager timing `stage`; a shared no-op when profiling is off."""
+    profiler = _active
+    if profiler is None:
+        return _NULL_SPAN
+    return profiler.span(stage)
+
+
+def shutdown(label: str = "PROFILE") -> None:
+    """Stop the profiler (if enabled), write its output and print the summary."""
+    global _active
+    profiler, _active = _active, None
+    if profiler is None:
+        return
+    profiler.stop()
+    print(f"[{label}] stage summary:\n{profiler.summary()}")
+    print(f"[{label}] collapsed stacks written to {profiler.path}")
@@ -6,15 +6,28 @@ Common packet format ⇒ 1-byte TAG + 2-byte LEN + LEN-byte BODY
 TAG  : b'T' = TCP, b'U' = UDP  (expandable to b'F' = file, b'C' = command, etc.)
 LEN  : 0 to 65535, network-byte-order (big-endian)
 BODY : bytes (UTF-8 encoding is up to the caller)
+
+Multiplexed frames (used by the gateway) carry another frame inside the BODY:
+
+TAG  : b'M'
+BODY : 4-byte STREAM ID (big-endian) + 1-byte inner TAG + inner BODY
 """
 
 from __future__ import annotations
 import struct
-from typing import Tuple
+import threading
+from typing import Dict, List, Tuple
+
+from chat import profiling  # chat/profiling.py
 
 _HEADER_FMT = "!BH"  # 1 byte + 2 bytes → big-endian unsigned char, unsigned short
 _HEADER_SIZE = struct.calcsize(_HEADER_FMT)  # = 3 bytes
 
+TAG_MUX = b"M"
+_MUX_FMT = "!IB"  # 4-byte stream id + 1-byte inner tag
+_MUX_SIZE = struct.calcsize(_MUX_FMT)  # = 5 bytes
+MAX_MUX_BODY = 0xFFFF - _MUX_SIZE
+
 
 def encode(body: bytes | str, tag: bytes = b"T") -> bytes:
     """
@@ -84,8 +97,122 @@ def decode(buffer: bytes | bytearray) -> Tuple[bytes, bytes, bytes]:
     return tag, body, rest
 
 
+def has_packet(buffer: bytes | bytearray) -> bool:
+    """True if `buffer` starts with a complete packet that `decode` can extract."""
+    return (
+        len(buffer) >= _HEADER_SIZE
+        and len(buffer) >= _HEADER_SIZE + (buffer[1] << 8 | buffer[2])
+    )
+
+
+# ---------- Multiplexed (gateway) frames ---------- #
+
+def encode_mux(stream_id: int, body: bytes | str, tag: bytes = b"T") -> bytes:
+    """
+    Serialize a payload for one logical stream inside a b'M' frame.
+
+    Parameters
+    ----------
+    stream_id : int
+        Logical stream identifier (0 to 2**32 - 1), assigned by the gateway.
+    body : bytes | str
+        The inner payload. If a str is provided, it will be UTF-8 encoded.
+    tag : bytes, optional
+        The inner 1-byte TAG. Defaults to b'T'.
+
+    Returns
+    -------
+    bytes
+        The complete serialized b'M' packet.
+    """
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    if len(tag) != 1:
+        raise ValueError("tag must be exactly 1 byte")
+    if len(body) > MAX_MUX_BODY:
+        raise ValueError(f"body length exceeds {MAX_MUX_BODY} bytes")
+
+    return encode(struct.pack(_MUX_FMT, stream_id, tag[0]) + body, tag=TAG_MUX)
+
+
+def decode_mux(body: bytes | bytearray) -> Tuple[int, bytes, bytes]:
+    """
+    Split the BODY of a b'M' frame into (stream_id, tag, body).
+
+    Raises
+    ------
+    ValueError
+        If the body is shorter than the 5-byte stream header.
+    """
+    if len(body) < _MUX_SIZE:
+        raise ValueError("incomplete mux header")
+
+    stream_id, tag_byte = struct.unpack(_MUX_FMT, body[:_MUX_SIZE])
+    return stream_id, bytes([tag_byte]), bytes(body[_MUX_SIZE:])
+
+
+# ---------- Receive buffer pool ---------- #
+
+class BufferPool:
+    """
+    Thread-safe free lists of receive buffers in power-of-two size classes.
+
+    A buffer is only borrowed when a frame body arrives in several pieces and
+    has to be assembled; idle connections hold no receive buffer at all.
+
+    Parameters
+    ----------
+    min_size : int, optional
+        Smallest size class in bytes (a power of two).
+    max_free : int, optional
+        Released buffers kept per size class; extras are dropped.
+    """
+
+    __slots__ = ("min_size", "max_free", "_free", "_lock")
+
+    def __init__(self, min_size: int = 256, max_free: int = 16):
+        self.min_size = min_size
+        self.max_free = max_free
+        self._free: Dict[int, List[bytearray]] = {}
+        self._lock = threading.Lock()
+
+    def size_class(self, n: int) -> int:
+        """Smallest buffer size handed out for an n-byte request."""
+        return max(self.min_size, 1 << (n - 1).bit_length())
+
+    def acquire(self, n: int) -> bytearray:
+        """Borrow a buffer of at least n bytes."""
+        size = self.size_class(n)
+        with self._lock:
+            free = self._free.get(size)
+            if free:
+                return free.pop()
+        return bytearray(size)
+
+    def release(self, buf: bytearray) -> None:
+        with self._lock:
+            free = self._free.setdefault(len(buf), [])
+            if len(free) < self.max_free:
+                free.append(buf)
+
+    def free_count(self) -> int:
+        return sum(len(free) for free in self._free.values())
+
+
+DEFAULT_POOL = BufferPool()
+
+
 # ---------- TCP stream-specific helpers ---------- #
 
+def _recv_into_exact(sock, view: memoryview) -> None:
+    """Fill `view` completely from a TCP socket."""
+    while view:
+        got = sock.recv_into(view)
+        if not got:
+            raise ConnectionError("socket closed before receiving expected bytes")
+        view = view[got:]
+
+
 def recv_exact(sock, n: int) -> bytes:
     """
     Block until exactly n bytes have been received from a TCP socket.
@@ -107,30 +234,66 @@ def recv_exact(sock, n: int) -> bytes:
     ConnectionError
         If the socket closes before n bytes are received.
     """
-    data = bytearray()
-    while len(data) < n:
-        chunk = sock.recv(n - len(data))
-        if not chunk:
-            raise ConnectionError("socket closed before receiving expected bytes")
-        data.extend(chunk)
+    data = bytearray(n)
+    _recv_into_exact(sock, memoryview(data))
     return bytes(data)
 
 
-def recv_packet_tcp(sock) -> Tuple[bytes, bytes]:
+def _recv_body(sock, n: int, pool: BufferPool) -> bytes:
+    """Receive an n-byte frame body, assembling it in a pooled buffer if split."""
+    if n == 0:
+        return b""
+    chunk = sock.recv(n)
+    if len(chunk) == n:
+        return chunk  # common case: the whole body was already buffered
+    if not chunk:
+        raise ConnectionError("socket closed before receiving expected bytes")
+
+    buf = pool.acquire(n)
+    try:
+        with memoryview(buf) as view:
+            view[:len(chunk)] = chunk
+            _recv_into_exact(sock, view[len(chunk):n])
+            return bytes(view[:n])
+    finally:
+        pool.release(buf)
+
+
+@profiling.idle_wait
+def _wait_header(sock) -> bytes:
+    """Block until the first header bytes of the next frame arrive."""
+    header = sock.recv(_HEADER_SIZE)
+    if not header:
+        raise ConnectionError("socket closed before receiving expected bytes")
+    return header
+
+
+def recv_packet_tcp(sock, pool: BufferPool = DEFAULT_POOL) -> Tuple[bytes, bytes]:
     """
     Receive exactly one packet (tag, body) from a TCP socket.
 
+    A body that arrives in one piece is returned as received (n bytes
+    allocated); a split body is assembled in a buffer of the smallest
+    fitting size class borrowed from `pool` for the duration of the call.
+
+    Only the reads (and the LEN field they need) count as the profiler's
+    "receive" stage; interpreting the frame is left to the caller.
+
     Parameters
     ----------
     sock : socket.socket
         The connected TCP socket.
+    pool : BufferPool, optional
+        Where to borrow assembly buffers from. Defaults to DEFAULT_POOL.
 
     Returns
     -------
     tag : bytes(1)
     body : bytes
     """
-    header = recv_exact(sock, _HEADER_SIZE)
-    tag_byte, body_len = struct.unpack(_HEADER_FMT, header)
-    body = recv_exact(sock, body_len)
-    return bytes([tag_byte]), body
+    header = _wait_header(sock)
+    with profiling.span("receive"):
+        if len(header) < _HEADER_SIZE:
+            header += recv_exact(sock, _HEADER_SIZE - len(header))
+        body = _recv_body(sock, header[1] << 8 | header[2], pool)
+    return header[:1], body
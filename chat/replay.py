@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+replay.py
+~~~~~~~~~
+Time-accurate playback of a traffic capture (see capture.py) against a server.
+
+• Every connection ID in the capture gets its own client connection
+• Frames are sent at their captured offsets, scaled by --speed
+  (1 = real time, N = N× faster, "max" = as fast as possible)
+• Each reply from the echo server is matched to the oldest outstanding
+  request with the same body, so a lost UDP datagram doesn't shift later
+  latencies (requests with identical bodies are still matched in order)
+• A frame that fails to send (e.g. too large for a UDP datagram) is
+  counted in `send_errors` and playback continues
+• The report can be saved as JSON and compared against a previous run
+
+Example
+-------
+$ python -m chat replay traffic.cap --host 127.0.0.1 --speed 10 --save run2.json --baseline run1.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import collections
+import json
+import socket
+import statistics
+import threading
+import time
+from typing import Deque, Dict, List, Optional, Tuple
+
+from chat import proto  # chat/proto.py
+from .capture import Record, load_capture
+
+BUF_SIZE = 65535
+START_DELAY = 0.2      # seconds between "all connected" and the first frame
+
+
+def parse_speed(value: str) -> Optional[float]:
+    """Return the speed factor, or None for "max"."""
+    if value.lower() == "max":
+        return None
+    speed = float(value)
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("speed must be > 0 or 'max'")
+    return speed
+
+
+class ReplayConnection:
+    """
+    Replays one captured connection and records per-frame latencies.
+
+    Parameters
+    ----------
+    records : List[Record]
+        The frames captured for this connection, in timestamp order.
+    addr : Tuple[str, int]
+        Target server address.
+    udp : bool
+        Send datagrams instead of a TCP stream.
+    """
+
+    def __init__(self, records: List[Record], addr: Tuple[str, int], udp: bool):
+        self.records = records
+        self.addr = addr
+        self.udp = udp
+        self.latencies: List[float] = []
+        self.sent = 0
+        self.send_errors = 0
+        self.last_reply = 0.0
+        # body -> send times of requests still waiting for their echo
+        self._pending: Dict[bytes, Deque[float]] = collections.defaultdict(collections.deque)
+        self._outstanding = 0
+        self._lock = threading.Lock()
+
+        if udp:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.sock.connect(addr)
+        else:
+            self.sock = socket.create_connection(addr)
+
+    def _receiver(self) -> None:
+        try:
+            while True:
+                if self.udp:
+                    data = self.sock.recv(BUF_SIZE)
+                    _, body, _ = proto.decode(data)
+                else:
+                    _, body = proto.recv_packet_tcp(self.sock)
+                now = time.perf_counter()
+                body = bytes(body)
+                with self._lock:
+                    waiting = self._pending.get(body)
+                    if not waiting:
+                        continue  # unsolicited or unmatched reply
+                    self.latencies.append(now - waiting.popleft())
+                    if not waiting:
+                        del self._pending[body]
+                    self._outstanding -= 1
+                self.last_reply = now
+        except (OSError, ConnectionError, ValueError):
+            return
+
+    def run(self, start: float, t0: float, speed: Optional[float], drain_timeout: float) -> None:
+        receiver = threading.Thread(target=self._receiver, daemon=True)
+        receiver.start()
+        delay = start - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        for ts, conn_id, tag, body in self.records:
+            if speed is not None:
+                delay = start + (ts - t0) / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            packet = proto.encode(body, tag=tag)
+            with self._lock:
+                self._pending[body].append(time.perf_counter())
+                self._outstanding += 1
+            try:
+                if self.udp:
+                    self.sock.send(packet)
+                else:
+                    self.sock.sendall(packet)
+            except OSError as exc:
+                with self._lock:
+                    self._pending[body].pop()
+                    if not self._pending[body]:
+                        del self._pending[body]
+                    self._outstanding -= 1
+                if not self.send_errors:
+                    print(f"[REPLAY] connection {conn_id}: send failed ({exc}); continuing")
+                self.send_errors += 1
+                continue
+            self.sent += 1
+
+        # Wait for outstanding replies, then wake the receiver and clean up
+        deadline = time.perf_counter() + drain_timeout
+        while self._outstanding and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        receiver.join()
+        self.sock.close()
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def replay(
+    records: List[Record],
+    addr: Tuple[str, int],
+    *,
+    speed: Optional[float] = 1.0,
+    udp: bool = False,
+    drain_timeout: float = 2.0,
+) -> Dict[str, float]:
+    """
+    Play `records` back against `addr` and return a report dict.
+
+    Returns
+    -------
+    Dict[str, float]
+        connections, frames_sent, send_errors, replies, lost, duration_s,
+        throughput_fps, latency_{mean,p50,p95,p99,max}_ms
+        (`lost` counts frames sent without a matching reply)
+    """
+    by_conn: Dict[int, List[Record]] = collections.defaultdict(list)
+    for rec in records:
+        by_conn[rec[1]].append(rec)
+
+    conns = [ReplayConnection(recs, addr, udp) for recs in by_conn.values()]
+    t0 = records[0][0] if records else 0.0
+    start = time.perf_counter() + START_DELAY
+
+    threads = [
+        threading.Thread(target=c.run, args=(start, t0, speed, drain_timeout), daemon=True)
+        for c in conns
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    end = max((c.last_reply for c in conns), default=0.0) or time.perf_counter()
+    duration = max(end - start, 1e-9)
+
+    latencies = sorted(lat for c in conns for lat in c.latencies)
+    sent = sum(c.sent for c in conns)
+    ms = 1000.0
+    return {
+        "connections": len(conns),
+        "frames_sent": sent,
+        "send_errors": sum(c.send_errors for c in conns),
+        "replies": len(latencies),
+        "lost": sent - len(latencies),
+        "duration_s": duration,
+        "throughput_fps": len(latencies) / duration,
+        "latency_mean_ms": statistics.fmean(latencies) * ms if latencies else 0.0,
+        "latency_p50_ms": _percentile(latencies, 50) * ms,
+        "latency_p95_ms": _percentile(latencies, 95) * ms,
+        "latency_p99_ms": _percentile(latencies, 99) * ms,
+        "latency_max_ms": latencies[-1] * ms if latencies else 0.0,
+    }
+
+
+def print_report(report: Dict[str, float], baseline: Optional[Dict[str, float]] = None) -> None:
+    """Print the report, with deltas against `baseline` if given."""
+    for key, value in report.items():
+        line = f"  {key:<18} {value:>12.3f}"
+        if baseline is not None and key in baseline:
+            old = baseline[key]
+            delta = f"{(value - old) / old * 100:+.1f}%" if old else "n/a"
+            line += f"   (baseline {old:>12.3f}, {delta})"
+        print(line)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Replay a CLI-Chat traffic capture")
+    ap.add_argument("capture", help="capture file written by --capture")
+    ap.add_argument("--host", default="127.0.0.1", help="Server address")
+    ap.add_argument("--port", type=int, default=9000, help="Server port")
+    ap.add_argument("--udp", action="store_true", help="replay over UDP instead of TCP")
+    ap.add_argument("--speed", type=parse_speed, default=1.0,
+                    help='playback speed factor, or "max" (default: 1)')
+    ap.add_argument("--drain-timeout", type=float, default=2.0,
+                    help="seconds to wait for outstanding replies")
+    ap.add_argument("--save", metavar="FILE", help="write the report as JSON")
+    ap.add_argument("--baseline", metavar="FILE", help="compare against a saved report")
+    args = ap.parse_args()
+
+    records = load_capture(args.capture)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+
+    speed_txt = "max" if args.speed is None else f"{args.speed:g}x"
+    print(f"[REPLAY] {len(records)} frames from {args.capture} → "
+          f"{args.host}:{args.port} ({'UDP' if args.udp else 'TCP'}, {speed_txt})")
+
+    report = replay(
+        records,
+        (args.host, args.port),
+        speed=args.speed,
+        udp=args.udp,
+        drain_timeout=args.drain_timeout,
+    )
+    print_report(report, baseline)
+
+    if args.save:
+        with open(args.save, "w") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"[REPLAY] report saved to {args.save}")
+
+
+if __name__ == "__main__":
+    main()
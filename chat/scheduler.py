@@ -0,0 +1,322 @@
+"""
+scheduler.py
+------------
+Priority-aware outbound queue for one socket.
+
+Priority classes
+----------------
+CONTROL     : health checks (b"__ping__") – always sent first
+INTERACTIVE : chat messages (everything not classified otherwise)
+BULK        : file transfers (TAG b'F')
+
+CONTROL frames jump the queue; INTERACTIVE and BULK share what is left by
+smooth weighted round-robin (default 4:1), so bulk data keeps moving
+without starving chat.
+
+Two ways to drive a scheduler:
+
+• inline (default) – there is no sender thread: whichever caller finds the
+  queue idle drains it, one frame per `sendall`, re-checking priorities
+  between frames. Suits sockets with several writing threads.
+• writer thread (`writer=True`) – for sockets where one reader thread
+  produces all replies (tcp_server, gateway clients). While nothing is
+  queued, `submit()` tries a non-blocking send right away; only when the
+  socket cannot take the whole frame does the rest go to a queue and a
+  per-connection writer thread start. The reader keeps reading while the
+  backlog drains, so a ping read behind it is still answered first. The
+  writer exits after WRITER_IDLE seconds without work, so pongs and
+  sporadic replies on idle connections never start a thread.
+  `max_pending_bytes` bounds the queued non-CONTROL data: past it `submit()`
+  blocks, so a peer that never reads pushes back on its sender exactly as
+  a blocking `sendall` would, while CONTROL frames still get through.
+
+Either way, a CONTROL frame waits for at most the frame currently on the wire.
+"""
+
+from __future__ import annotations
+import collections
+import socket
+import threading
+from typing import Deque, Dict, Optional, Tuple
+
+from chat import proto  # chat/proto.py
+
+CONTROL = 0
+INTERACTIVE = 1
+BULK = 2
+
+PING = b"__ping__"
+TAG_FILE = b"F"
+DEFAULT_WEIGHTS = {INTERACTIVE: 4, BULK: 1}
+WRITER_IDLE = 1.0  # seconds an idle writer thread lingers before exiting
+_MSG_DONTWAIT = getattr(socket, "MSG_DONTWAIT", 0)  # 0 where unsupported: always queue
+
+_Item = Tuple[bytes, Optional[Tuple[str, int]]]  # (packet, UDP peer or None)
+
+
+class SendQueueFull(OSError):
+    """Raised by a non-blocking `submit()` when the outbound queue is full."""
+
+
+def classify(packet: bytes) -> int:
+    """
+    Return the priority class of an encoded packet.
+
+    b'M' frames are classified by their inner tag and body.
+    """
+    try:
+        tag, body, _ = proto.decode(packet)
+        if tag == proto.TAG_MUX:
+            _, tag, body = proto.decode_mux(body)
+    except ValueError:
+        return INTERACTIVE
+    if body == PING:
+        return CONTROL
+    if tag == TAG_FILE:
+        return BULK
+    return INTERACTIVE
+
+
+class SendScheduler:
+    """
+    Serialize and prioritise all writes to one socket (thread-safe).
+
+    Queues are only allocated the first time a frame has to wait, so an
+    uncontended connection costs one small slotted object and a lock.
+
+    Parameters
+    ----------
+    sock : socket.socket
+        A connected TCP socket, or a UDP socket used with `addr=`.
+    weights : Dict[int, int], optional
+        Round-robin weights for INTERACTIVE and BULK. Defaults to 4:1.
+    writer : bool, default=False
+        Send from a per-connection writer thread instead of inline.
+    max_pending_bytes : int, optional
+        Writer mode only: bound on queued non-CONTROL bytes. A frame that
+        would exceed it (unless the queue is empty) blocks `submit()`, or
+        raises SendQueueFull with `block=False`.
+    """
+
+    __slots__ = (
+        "sock", "weights", "writer", "max_pending_bytes",
+        "_queues", "_credit", "_queued_bytes", "_lock", "_cond", "_draining",
+        "_closed", "_error",
+    )
+
+    def __init__(
+        self,
+        sock: socket.socket,
+        weights: Optional[Dict[int, int]] = None,
+        *,
+        writer: bool = False,
+        max_pending_bytes: Optional[int] = None,
+    ):
+        self.sock = sock
+        self.weights = dict(weights or DEFAULT_WEIGHTS)
+        self.writer = writer
+        self.max_pending_bytes = max_pending_bytes
+        self._queues: Optional[Dict[int, Deque[_Item]]] = None
+        self._credit: Optional[Dict[int, int]] = None
+        self._queued_bytes = 0  # non-CONTROL bytes waiting in the queues
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock) if writer else None
+        self._draining = False  # a sender (inline drainer or writer thread) is active
+        self._closed = False
+        self._error: Optional[OSError] = None
+
+    def pending(self) -> int:
+        """Number of frames queued but not yet sent."""
+        if self._queues is None:
+            return 0
+        return sum(len(q) for q in self._queues.values())
+
+    def pending_bytes(self) -> int:
+        """Bytes of non-CONTROL frames queued but not yet sent."""
+        return self._queued_bytes
+
+    def submit(
+        self,
+        packet: bytes,
+        priority: Optional[int] = None,
+        addr: Optional[Tuple[str, int]] = None,
+        *,
+        block: bool = True,
+    ) -> None:
+        """
+        Queue one encoded packet for sending.
+
+        Inline mode sends it immediately if the socket is idle. Writer mode
+        sends it without blocking if nothing is queued and the socket takes
+        it whole; otherwise it queues it for the writer thread and returns.
+
+        Parameters
+        ----------
+        packet : bytes
+            A complete proto frame.
+        priority : int, optional
+            CONTROL, INTERACTIVE or BULK; classified from the packet if omitted.
+        addr : Tuple[str, int], optional
+            Destination for UDP sockets (uses `sendto`).
+        block : bool, default=True
+            Writer mode only: wait for space when the queue is full.
+
+        Raises
+        ------
+        SendQueueFull
+            If the queue is full and `block` is False.
+        OSError
+            If this or an earlier send on the socket failed.
+        """
+        with self._lock:
+            self._check()
+            if self.writer:
+                if priority is None:
+                    priority = classify(packet)
+                self._wait_for_space(priority, len(packet), block)
+                if not self._draining and addr is None:
+                    sent = self._try_send(packet)
+                    if sent == len(packet):
+                        return
+                    if sent:
+                        # The tail of a started frame must go out before anything else
+                        packet, priority = packet[sent:], CONTROL
+                self._enqueue(priority, (packet, addr))
+                if self._draining:
+                    self._cond.notify_all()
+                else:
+                    self._draining = True
+                    threading.Thread(target=self._write_loop, daemon=True, name="writer").start()
+                return
+            if self._draining:
+                # Another caller is sending; it will pick this one up
+                if priority is None:
+                    priority = classify(packet)
+                self._enqueue(priority, (packet, addr))
+                return
+            self._draining = True
+        self._drain((packet, addr))
+
+    def close(self) -> None:
+        """Refuse further frames; a writer thread exits once its queue is empty."""
+        with self._lock:
+            self._closed = True
+            if self._cond is not None:
+                self._cond.notify_all()
+
+    # ---------- Internal helpers ---------- #
+    def _check(self) -> None:
+        """Raise if the socket failed or the scheduler was closed (lock held)."""
+        if self._error is not None:
+            raise self._error
+        if self._closed:
+            raise ConnectionError("send scheduler closed")
+
+    def _wait_for_space(self, priority: int, size: int, block: bool) -> None:
+        """Apply the `max_pending_bytes` bound; CONTROL is never held back (lock held)."""
+        limit = self.max_pending_bytes
+        if limit is None or priority == CONTROL:
+            return
+        while self._queued_bytes and self._queued_bytes + size > limit:
+            if not block:
+                raise SendQueueFull(f"{self._queued_bytes} bytes already queued")
+            self._cond.wait()
+            self._check()
+
+    def _try_send(self, packet: bytes) -> int:
+        """Send what the socket takes without blocking; return the byte count (lock held)."""
+        if not _MSG_DONTWAIT or self.sock.gettimeout():
+            return 0  # a timeout socket would wait for writability first
+        try:
+            return self.sock.send(packet, _MSG_DONTWAIT)
+        except BlockingIOError:
+            return 0
+        except OSError as exc:
+            self._error = exc
+            raise
+
+    def _enqueue(self, priority: int, item: _Item) -> None:
+        """Append to the class queue, allocating queues on first use (lock held)."""
+        if self._queues is None:
+            self._queues = {
+                CONTROL: collections.deque(),
+                INTERACTIVE: collections.deque(),
+                BULK: collections.deque(),
+            }
+            self._credit = {INTERACTIVE: 0, BULK: 0}
+        self._queues[priority].append(item)
+        if priority != CONTROL:
+            self._queued_bytes += len(item[0])
+
+    def _next(self) -> Optional[_Item]:
+        """Pop the next item to send (caller holds the lock)."""
+        queues = self._queues
+        if queues is None:
+            return None
+        if queues[CONTROL]:
+            return queues[CONTROL].popleft()
+
+        ready = [p for p in (INTERACTIVE, BULK) if queues[p]]
+        if not ready:
+            return None
+        if len(ready) == 1:
+            chosen = ready[0]
+        else:
+            # Smooth weighted round-robin between the non-empty classes
+            total = 0
+            for p in ready:
+                self._credit[p] += self.weights[p]
+                total += self.weights[p]
+            chosen = max(ready, key=self._credit.__getitem__)
+            self._credit[chosen] -= total
+        item = queues[chosen].popleft()
+        self._queued_bytes -= len(item[0])
+        return item
+
+
+    def _send(self, item: _Item) -> bool:
+        """Send one item; on a TCP error record it and stop sending."""
+        packet, addr = item
+        try:
+            if addr is None:
+                self.sock.sendall(packet)
+            else:
+                self.sock.sendto(packet, addr)
+        except OSError as exc:
+            if addr is not None:
+                return True  # a UDP peer error doesn't poison the socket
+            with self._lock:
+                self._error = exc
+                self._queues = None
+                self._queued_bytes = 0
+                self._draining = False
+                if self._cond is not None:
+                    self._cond.notify_all()
+            return False
+        return True
+
+    def _drain(self, item: _Item) -> None:
+        """Send `item`, then keep sending queued items until none are left."""
+        while True:
+            if not self._send(item):
+                raise self._error
+            with self._lock:
+                item = self._next()
+                if item is None:
+                    self._draining = False
+                    return
+
+    def _write_loop(self) -> None:
+        """Writer-thread body: send queued items, exit once idle for WRITER_IDLE."""
+        while True:
+            with self._lock:
+                item = self._next()
+                if item is None and not self._closed:
+                    self._cond.wait(WRITER_IDLE)
+                    item = self._next()
+                if item is None:
+                    self._draining = False
+                    return
+                self._cond.notify_all()  # wake submitters waiting for space
+            if not self._send(item):
+                return
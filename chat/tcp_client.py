@@ -6,6 +6,8 @@ Main interactive client for CLI-Chat.
 
 • Primary transport is TCP; if disconnected, LinkMonitor will automatically switch to UDP
 • Uses common packet format from proto.py (1-byte TAG + 2-byte LEN + BODY)
+• TCP writes (chat and pings) share one SendScheduler, so pings go first
+• --profile FILE enables the built-in profiler (see profiling.py)
 • Chat between stdin and server; exit on Ctrl-D or Ctrl-C
 """
 
@@ -17,8 +19,9 @@ import socket
 import sys
 from typing import Tuple
 
-from chat import proto  # chat/proto.py
+from chat import profiling, proto  # chat/profiling.py, chat/proto.py
 from .link_monitor import LinkMonitor
+from .scheduler import SendScheduler
 
 TAG_TCP = b"T"
 TAG_UDP = b"U"
@@ -40,20 +43,33 @@ def create_udp_socket() -> socket.socket:
     return sock
 
 
+@profiling.idle_wait
+def _wait_readable(rlist: list) -> list:
+    """Block until stdin or a server socket is readable."""
+    readable, _, _ = select.select(rlist, [], [])
+    return readable
+
+
 def main() -> None:
     # ----- argparse configuration -----
     ap = argparse.ArgumentParser(description="CLI-Chat client with TCP→UDP fail-over")
     ap.add_argument("--host", required=True, help="Server address")
     ap.add_argument("--tcp-port", type=int, default=9000, help="Server TCP port")
     ap.add_argument("--udp-port", type=int, default=9001, help="Server UDP port")
+    ap.add_argument("--profile", metavar="FILE",
+                    help="sample stacks to FILE (collapsed) and time hot-path stages")
     args = ap.parse_args()
 
+    if args.profile:
+        profiling.enable(args.profile)
+
     server_tcp = (args.host, args.tcp_port)
     server_udp = (args.host, args.udp_port)
 
     # ----- socket setup -----
     tcp_sock = create_tcp_socket(server_tcp)
     udp_sock = create_udp_socket()
+    tcp_out = SendScheduler(tcp_sock)
 
     # ----- link monitor start -----
     def on_switch(ch: str) -> None:
@@ -64,6 +80,7 @@ def main() -> None:
         udp_sock,
         server_udp,
         on_switch_cb=on_switch,
+        scheduler=tcp_out,
     )
     monitor.start()
 
@@ -86,7 +103,7 @@ def main() -> None:
             else:
                 rlist.append(udp_sock)
 
-            readable, _, _ = select.select(rlist, [], [])
+            readable = _wait_readable(rlist)
 
             # ----- 1) User input -----
             if sys.stdin in readable:
@@ -95,12 +112,14 @@ def main() -> None:
                     break
                 body = line.rstrip("\n").encode()
                 tag = TAG_TCP if monitor.active == "tcp" else TAG_UDP
-                packet = proto.encode(body, tag=tag)
+                with profiling.span("encode"):
+                    packet = proto.encode(body, tag=tag)
                 try:
-                    if monitor.active == "tcp":
-                        tcp_sock.sendall(packet)
-                    else:
-                        udp_sock.sendto(packet, server_udp)
+                    with profiling.span("send"):
+                        if monitor.active == "tcp":
+                            tcp_out.submit(packet)
+                        else:
+                            udp_sock.sendto(packet, server_udp)
                 except (BrokenPipeError, OSError):
                     # Sending failed; monitor will switch channels
                     pass
@@ -108,28 +127,31 @@ def main() -> None:
             # ----- 2) Server response -----
             if monitor.active == "tcp" and tcp_sock in readable:
                 try:
-                    chunk = tcp_sock.recv(BUF_SIZE)
+                    with profiling.span("receive"):
+                        chunk = tcp_sock.recv(BUF_SIZE)
                     if not chunk:
                         raise ConnectionError("TCP closed by server")
                     tcp_buffer.extend(chunk)
-                    while True:
-                        try:
+                    while proto.has_packet(tcp_buffer):
+                        with profiling.span("decode"):
                             tag, body, rest = proto.decode(tcp_buffer)
-                        except ValueError:
-                            break        # incomplete packet
                         tcp_buffer[:] = rest
-                        if body != PING:
-                            print(f"\n← {body.decode(errors='replace')}")
+                        with profiling.span("handle"):
+                            if body != PING:
+                                print(f"\n← {body.decode(errors='replace')}")
                 except Exception:
                     # Monitor will handle switching
                     pass
 
             if monitor.active == "udp" and udp_sock in readable:
                 try:
-                    data, _ = udp_sock.recvfrom(BUF_SIZE)
-                    _, body, _ = proto.decode(data)
-                    if body != PING:
-                        print(f"\n← {body.decode(errors='replace')}")
+                    with profiling.span("receive"):
+                        data, _ = udp_sock.recvfrom(BUF_SIZE)
+                    with profiling.span("decode"):
+                        _, body, _ = proto.decode(data)
+                    with profiling.span("handle"):
+                        if body != PING:
+                            print(f"\n← {body.decode(errors='replace')}")
                 except Exception:
                     pass
 
@@ -141,6 +163,7 @@ def main() -> None:
         monitor.join()
         tcp_sock.close()
         udp_sock.close()
+        profiling.shutdown("CLIENT")
 
 
 if __name__ == "__main__":
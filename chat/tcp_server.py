@@ -7,6 +7,17 @@ Simple multithreaded TCP echo server for the CLI-Chat project.
 Packet format  : see proto.py  ->  1-byte TAG | 2-byte LEN | BODY
 TAG values     : b'T' (TCP data)  –  you can extend later if needed
 Special body   : b"__ping__"      –  replied immediately for health-checks
+Mux frames     : b'M' frames from a gateway (see gateway.py) are unwrapped,
+                 handled per stream and answered on the same stream ID
+
+Replies are queued on a per-connection SendScheduler in writer mode (see
+scheduler.py): the handler thread keeps reading while a writer thread sends,
+so ping replies overtake any chat or file backlog queued for the same client.
+
+Per-client state lives in a slotted Connection record (see connection.py)
+and handler threads get a reduced stack, keeping idle clients cheap.
+
+--profile FILE enables the built-in profiler (see profiling.py).
 
 The server accepts multiple concurrent clients, runs one thread per client,
 and echoes every non-ping message back to the sender (for demo purposes).
@@ -17,65 +28,125 @@ If you want group chat, replace the `echo_back()` call with a broadcast loop.
 from __future__ import annotations
 
 import argparse
+import itertools
 import socket
 import threading
-from typing import Tuple
+from typing import Optional, Tuple
 
-from chat import proto  # chat/proto.py
+from chat import profiling, proto  # chat/profiling.py, chat/proto.py
+from .capture import CaptureWriter
+from .connection import Connection
+from .scheduler import BULK, CONTROL, INTERACTIVE, TAG_FILE, SendScheduler
 
 # --------------------------------------------------------------------------- #
 PING_BODY = b"__ping__"
 TAG_TCP = b"T"
 BUFFER = 1 << 14  # 16 KiB
+HANDLER_STACK_SIZE = 256 << 10  # 256 KiB per client thread (default is ~8 MiB)
 
 # --------------------------------------------------------------------------- #
-def echo_back(sock: socket.socket, payload: bytes) -> None:
-    """Send `payload` back to the connected TCP socket, framed for TCP."""
+def reply_priority(tag: bytes, body: bytes) -> int:
+    """Priority class for the reply to an inbound (tag, body) frame."""
+    if body == PING_BODY:
+        return CONTROL
+    return BULK if tag == TAG_FILE else INTERACTIVE
+
+
+def decode_frame(tag: bytes, body: bytes) -> Tuple[Optional[int], bytes, bytes]:
+    """
+    Interpret one received frame as (stream_id, tag, body).
+
+    b'M' frames from a gateway are unwrapped to their inner frame; plain
+    frames pass through with stream_id None. Raises ValueError if a mux
+    frame is malformed.
+    """
+    if tag == proto.TAG_MUX:
+        return proto.decode_mux(body)
+    return None, tag, body
+
+
+def echo_back(
+    out: SendScheduler,
+    payload: bytes,
+    priority: int = INTERACTIVE,
+    stream_id: Optional[int] = None,
+) -> None:
+    """Queue `payload` back to the client, on the same gateway stream if any."""
+    with profiling.span("encode"):
+        if stream_id is None:
+            packet = proto.encode(payload, tag=TAG_TCP)
+        else:
+            packet = proto.encode_mux(stream_id, payload, tag=TAG_TCP)
     try:
-        sock.sendall(proto.encode(payload, tag=TAG_TCP))
+        with profiling.span("send"):
+            out.submit(packet, priority)
     except OSError:
         # Broken pipe or other I/O error – the handler thread will exit soon
         pass
 
 
-def client_handler(sock: socket.socket, addr: Tuple[str, int]) -> None:
-    """Serve a single client until it disconnects."""
+def client_handler(conn: Connection, capture: Optional[CaptureWriter] = None) -> None:
+    """
+    Serve a single client until it disconnects, optionally recording its frames.
+
+    Every frame passes through each profiling stage exactly once: receive
+    (proto), decode, handle (capture + log), then encode and send.
+    """
+    addr, out = conn.addr, conn.out
     print(f"[TCP-SERVER] New client {addr}")
 
     try:
         # Loop until the client closes the connection
         while True:
             try:
-                tag, body = proto.recv_packet_tcp(sock)
+                tag, body = conn.recv_packet()
             except ConnectionError:
                 break  # socket closed
             except ValueError:
                 # Malformed packet – skip or optionally close connection
                 continue
 
-            # Health-check ping
-            if body == PING_BODY:
-                echo_back(sock, PING_BODY)
-                continue
+            try:
+                with profiling.span("decode"):
+                    stream_id, inner_tag, inner_body = decode_frame(tag, body)
+            except ValueError:
+                inner_body = None  # malformed mux frame – record it, then drop it
+
+            with profiling.span("handle"):
+                if capture is not None:
+                    capture.record(conn.conn_id, tag, body)
+                # Health-check pings are answered without logging
+                if inner_body is not None and inner_body != PING_BODY:
+                    if stream_id is None:
+                        print(f"[TCP-SERVER] {addr} -> {inner_body!r}")
+                    else:
+                        print(f"[TCP-SERVER] {addr}#{stream_id} -> {inner_body!r}")
 
             # Normal chat payload – here we simply echo
-            print(f"[TCP-SERVER] {addr} -> {body!r}")
-            echo_back(sock, body)
+            if inner_body is not None:
+                echo_back(out, inner_body, reply_priority(inner_tag, inner_body), stream_id)
 
     finally:
         print(f"[TCP-SERVER] Client {addr} disconnected")
-        try:
-            sock.close()
-        except Exception:
-            pass
+        conn.close()
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="CLI-Chat TCP echo server")
     parser.add_argument("--host", default="0.0.0.0", help="bind address")
     parser.add_argument("--port", type=int, default=9000, help="TCP port")
+    parser.add_argument("--capture", metavar="FILE", help="record every inbound frame to FILE")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="sample stacks to FILE (collapsed) and time hot-path stages")
     args = parser.parse_args()
 
+    if args.profile:
+        profiling.enable(args.profile)
+
+    capture = CaptureWriter(args.capture) if args.capture else None
+    conn_ids = itertools.count(1)
+    threading.stack_size(HANDLER_STACK_SIZE)
+
     # Create, bind, and listen
     serv_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     serv_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -83,18 +154,23 @@ def main() -> None:
     serv_sock.listen()
 
     print(f"[TCP-SERVER] Listening on {args.host}:{args.port} (Ctrl-C to quit)")
+    if capture is not None:
+        print(f"[TCP-SERVER] Capturing inbound frames to {args.capture}")
 
     try:
         while True:
             client_sock, client_addr = serv_sock.accept()
-            t = threading.Thread(
-                target=client_handler, args=(client_sock, client_addr), daemon=True
-            )
+            conn = Connection(client_sock, client_addr, next(conn_ids))
+            t = threading.Thread(target=client_handler, args=(conn, capture), daemon=True)
             t.start()
     except KeyboardInterrupt:
         print("\n[TCP-SERVER] Shutting down…")
     finally:
         serv_sock.close()
+        if capture is not None:
+            capture.close()
+            print(f"[TCP-SERVER] {capture.count} frames captured to {args.capture}")
+        profiling.shutdown("TCP-SERVER")
 
 
 if __name__ == "__main__":
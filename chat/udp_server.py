@@ -8,54 +8,110 @@ BODY    : bytes (UTF-8 encoding is up to the sender)
 
 • Ping packets (b"__ping__") are replied to directly
 • All other messages are echoed back to the client
+• --capture FILE records every inbound frame (see capture.py)
+• Replies share one SendScheduler, so pongs are sent ahead of queued echoes
+• --profile FILE enables the built-in profiler (see profiling.py)
 """
 
 from __future__ import annotations
 import argparse
 import socket
 import threading
-from typing import Tuple
+import time
+from typing import Dict, Optional, Tuple
 
-from chat import proto  # chat/proto.py
+from chat import profiling, proto  # chat/profiling.py, chat/proto.py
+from .capture import CaptureWriter
+from .scheduler import BULK, CONTROL, INTERACTIVE, TAG_FILE, SendScheduler
 
 PING = b"__ping__"
 TAG_UDP = b"U"
 BUF_SIZE = 65535
 
 
-def handle_packet(sock: socket.socket, data: bytes, addr: Tuple[str, int]) -> None:
+@profiling.idle_wait
+def _wait_datagram(sock: socket.socket) -> Tuple[bytes, Tuple[str, int]]:
+    """Block until the next datagram arrives."""
+    return sock.recvfrom(BUF_SIZE)
+
+
+def handle_packet(
+    out: SendScheduler,
+    data: bytes,
+    addr: Tuple[str, int],
+    capture: Optional[CaptureWriter] = None,
+    conn_id: int = 0,
+    ts: Optional[float] = None,
+) -> None:
     """
-    Decode incoming packet, process it, and send a response.
+    Decode incoming packet, process it, and queue a response.
+
+    Each datagram passes through decode, handle (capture + log), encode
+    and send exactly once. `ts` is the arrival time taken by the receive
+    loop, so captures keep arrival order and exclude thread start-up.
     """
     try:
-        _, body, _ = proto.decode(data)        # Tag isn't needed here
+        with profiling.span("decode"):
+            tag, body, _ = proto.decode(data)
     except ValueError:
         print(f"[WARN] malformed packet from {addr}")
         return
 
-    if body == PING:
-        sock.sendto(proto.encode(PING, tag=TAG_UDP), addr)
-        return
+    with profiling.span("handle"):
+        if capture is not None:
+            capture.record(conn_id, tag, body, ts)
+        if body == PING:
+            priority = CONTROL
+        else:
+            print(f"← {addr}: {body!r}")
+            priority = BULK if tag == TAG_FILE else INTERACTIVE
 
-    print(f"← {addr}: {body!r}")
-    sock.sendto(proto.encode(body, tag=TAG_UDP), addr)   # Echo back
+    with profiling.span("encode"):
+        packet = proto.encode(body, tag=TAG_UDP)
+    with profiling.span("send"):
+        out.submit(packet, priority, addr=addr)   # Echo back
 
 
 def main() -> None:
     ap = argparse.ArgumentParser(description="UDP echo server (backup channel)")
     ap.add_argument("--host", default="0.0.0.0", help="Bind address")
     ap.add_argument("--port", type=int, default=9001, help="UDP port")
+    ap.add_argument("--capture", metavar="FILE", help="record every inbound frame to FILE")
+    ap.add_argument("--profile", metavar="FILE",
+                    help="sample stacks to FILE (collapsed) and time hot-path stages")
     args = ap.parse_args()
 
+    if args.profile:
+        profiling.enable(args.profile)
+
+    capture = CaptureWriter(args.capture) if args.capture else None
+    conn_ids: Dict[Tuple[str, int], int] = {}  # peer address -> connection id
+
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     sock.bind((args.host, args.port))
+    out = SendScheduler(sock)
     print(f"[UDP-SERVER] listening on {args.host}:{args.port}")
+    if capture is not None:
+        print(f"[UDP-SERVER] capturing inbound frames to {args.capture}")
 
-    while True:
-        data, addr = sock.recvfrom(BUF_SIZE)
-        threading.Thread(target=handle_packet,
-                         args=(sock, data, addr),
-                         daemon=True).start()
+    try:
+        while True:
+            data, addr = _wait_datagram(sock)
+            conn_id, ts = 0, None
+            if capture is not None:
+                ts = time.time()
+                conn_id = conn_ids.setdefault(addr, len(conn_ids) + 1)
+            threading.Thread(target=handle_packet,
+                             args=(out, data, addr, capture, conn_id, ts),
+                             daemon=True).start()
+    except KeyboardInterrupt:
+        print("\n[UDP-SERVER] shutting down…")
+    finally:
+        sock.close()
+        if capture is not None:
+            capture.close()
+            print(f"[UDP-SERVER] {capture.count} frames captured to {args.capture}")
+        profiling.shutdown("UDP-SERVER")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,67 @@
+import pytest
+
+from chat.capture import MAGIC, CaptureWriter, load_capture, read_capture
+
+FRAMES = [(1, b"T", b"hello"), (2, b"F", b"x" * 65535), (1, b"T", b"")]
+LAST_RECORD = 12 + 3  # record header + frame header of the empty last frame
+
+
+def _write(path):
+    writer = CaptureWriter(str(path))
+    for conn_id, tag, body in FRAMES:
+        writer.record(conn_id, tag, body)
+    return writer
+
+
+def test_record_round_trip(tmp_path):
+    path = tmp_path / "traffic.cap"
+    _write(path).close()
+    records = list(read_capture(str(path)))
+    assert [(c, t, b) for _, c, t, b in records] == FRAMES
+    stamps = [ts for ts, *_ in records]
+    assert stamps == sorted(stamps)
+
+
+def test_capture_is_readable_while_still_open(tmp_path):
+    path = tmp_path / "live.cap"
+    writer = _write(path)
+    assert len(load_capture(str(path))) == len(FRAMES)
+    writer.close()
+
+
+def test_bad_magic_is_rejected(tmp_path):
+    path = tmp_path / "bogus.cap"
+    path.write_bytes(b"NOTACAP!" + b"\0" * 20)
+    with pytest.raises(ValueError, match="not a CLI-Chat capture"):
+        list(read_capture(str(path)))
+
+
+@pytest.mark.parametrize("keep", [1, 11, 12, 14])
+def test_truncated_tail_keeps_complete_records(tmp_path, capsys, keep):
+    path = tmp_path / "cut.cap"
+    _write(path).close()
+    data = path.read_bytes()
+    # keep only the first `keep` bytes of the last record, as after a kill
+    path.write_bytes(data[:len(data) - LAST_RECORD + keep])
+    records = list(read_capture(str(path)))
+    assert [(c, t, b) for _, c, t, b in records] == FRAMES[:2]
+    assert "ignoring the rest" in capsys.readouterr().out
+
+
+def test_empty_capture_has_no_records(tmp_path):
+    path = tmp_path / "empty.cap"
+    path.write_bytes(MAGIC)
+    assert load_capture(str(path)) == []
+
+
+def test_record_keeps_given_arrival_time(tmp_path):
+    path = tmp_path / "udp.cap"
+    writer = CaptureWriter(str(path))
+    # a worker thread that started late records the second datagram first
+    writer.record(7, b"U", b"second", ts=1000.2)
+    writer.record(7, b"U", b"first", ts=1000.1)
+    writer.close()
+    assert [(ts, body) for ts, _, _, body in load_capture(str(path))] == [
+        (1000.1, b"first"),
+        (1000.2, b"second"),
+    ]
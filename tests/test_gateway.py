@@ -0,0 +1,158 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from chat import proto
+from chat.connection import Connection
+from chat.gateway import UPSTREAM_MAX_PENDING_BYTES, Gateway, Upstream
+from chat.tcp_server import client_handler
+
+
+def _serve(listener, handler):
+    while True:
+        try:
+            sock, addr = listener.accept()
+        except OSError:
+            return
+        threading.Thread(target=handler, args=(sock, addr), daemon=True).start()
+
+
+def _listen():
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+    return listener
+
+
+@pytest.fixture
+def gateway():
+    core = _listen()
+    threading.Thread(
+        target=_serve,
+        args=(core, lambda s, a: client_handler(Connection(s, a))),
+        daemon=True,
+    ).start()
+
+    upstream = Upstream(core.getsockname(), 0, interval=0.1, timeout=0.5)
+    upstream.start()
+    gw = Gateway([upstream])
+    front = _listen()
+    threading.Thread(target=_serve, args=(front, gw.client_handler), daemon=True).start()
+
+    yield upstream, front.getsockname()
+
+    upstream.stop()
+    front.close()
+    core.close()
+
+
+def _connect(addr):
+    sock = socket.create_connection(addr)
+    sock.settimeout(5)
+    return sock
+
+
+def test_oversize_frame_is_rejected_with_reply(gateway):
+    _, addr = gateway
+    client = _connect(addr)
+    client.sendall(proto.encode(b"x" * (proto.MAX_MUX_BODY + 3)))
+    _, body = proto.recv_packet_tcp(client)
+    assert b"too large" in body
+    client.close()
+
+
+def test_stalled_client_does_not_take_down_the_link(gateway):
+    upstream, addr = gateway
+    link = upstream.sock
+    stalled = _connect(addr)
+    healthy = _connect(addr)
+
+    def flood():
+        frame = proto.encode(b"x" * 60000, tag=b"F")
+        try:
+            for _ in range(2000):
+                stalled.sendall(frame)
+        except OSError:
+            pass  # the gateway disconnected us
+
+    flooder = threading.Thread(target=flood, daemon=True)
+    flooder.start()
+    flooder.join(30)
+    assert not flooder.is_alive(), "stalled client was never disconnected"
+
+    healthy.sendall(proto.encode(b"hello"))
+    assert proto.recv_packet_tcp(healthy) == (b"T", b"hello")
+    time.sleep(0.3)  # a few ping intervals
+    assert upstream.alive.is_set() and upstream.sock is link
+    healthy.close()
+    stalled.close()
+
+
+def test_slow_core_link_pushes_back_on_clients():
+    core = _listen()  # accepts the link but never reads from it
+    accepted = []
+    threading.Thread(target=lambda: accepted.append(core.accept()), daemon=True).start()
+    upstream = Upstream(core.getsockname(), 0, interval=30, timeout=0.5)
+    upstream.start()
+    front = _listen()
+    threading.Thread(
+        target=_serve, args=(front, Gateway([upstream]).client_handler), daemon=True
+    ).start()
+
+    frame = proto.encode(b"x" * 60000, tag=b"F")
+
+    def flood():
+        client = _connect(front.getsockname())
+        client.settimeout(1)
+        try:
+            for _ in range(200):
+                client.sendall(frame)
+        except socket.timeout:
+            pass  # the gateway stopped reading us
+        clients.append(client)
+
+    clients = []
+    flooders = [threading.Thread(target=flood, daemon=True) for _ in range(3)]
+    for t in flooders:
+        t.start()
+    for t in flooders:
+        t.join(30)
+
+    assert upstream.out.pending_bytes() <= UPSTREAM_MAX_PENDING_BYTES
+    upstream.stop()
+    for client in clients:
+        client.close()
+    front.close()
+    core.close()
+
+
+class _SlowEvent(threading.Event):
+    """An Event whose clear() is slow, widening _drop's check-then-act window."""
+
+    def clear(self):
+        time.sleep(0.01)
+        super().clear()
+
+
+def test_link_is_dropped_once_when_callers_race(gateway, capsys):
+    upstream, _ = gateway
+    upstream.alive = _SlowEvent()
+    for _ in range(5):
+        assert upstream.sock is not None or upstream._connect()
+        sock = upstream.sock
+        start = threading.Barrier(3)
+
+        def drop():
+            start.wait()
+            upstream._drop(sock)
+
+        droppers = [threading.Thread(target=drop) for _ in range(3)]
+        for t in droppers:
+            t.start()
+        for t in droppers:
+            t.join()
+        assert upstream.sock is None and not upstream.alive.is_set()
+    time.sleep(0.1)  # let the readers of the dropped links finish
+    assert capsys.readouterr().out.count("lost") == 5
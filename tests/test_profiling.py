@@ -0,0 +1,104 @@
+import socket
+import threading
+import time
+
+from chat import profiling, proto
+from chat.profiling import Profiler
+
+
+def busy_worker(stop: threading.Event) -> None:
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_sampler_skips_idle_waits_and_roots_stacks_at_target():
+    pairs = [socket.socketpair() for _ in range(20)]
+    idle = [threading.Thread(target=proto.recv_packet_tcp, args=(b,), daemon=True)
+            for _, b in pairs]
+    stop = threading.Event()
+    busy = [threading.Thread(target=busy_worker, args=(stop,), daemon=True) for _ in range(3)]
+    for t in idle + busy:
+        t.start()
+    waiting = threading.Event()
+    threading.Thread(target=waiting.wait, daemon=True).start()
+    time.sleep(0.2)  # let every thread reach its wait
+
+    profiler = Profiler("/dev/null")
+    for _ in range(20):
+        profiler._sample()
+    stop.set()
+    waiting.set()
+
+    stacks = list(profiler.samples)
+    assert profiler.idle >= 20 * 20
+    assert not any("_wait_header" in s or "threading.py:wait" in s for s in stacks)
+    roots = {s.split(";", 1)[0] for s in stacks}
+    assert "test_profiling.py:busy_worker" in roots
+    assert not any(r.startswith(("Thread-", "threading.py:")) for r in roots)
+    for (a, b), t in zip(pairs, idle):
+        a.sendall(proto.encode(b"bye"))
+        t.join(5)
+        a.close()
+        b.close()
+
+
+def test_span_is_shared_noop_when_disabled():
+    assert profiling.span("decode") is profiling.span("send")
+
+
+def test_stages_are_counted_once_per_frame(tmp_path):
+    from chat.capture import CaptureWriter
+    from chat.connection import Connection
+    from chat.tcp_server import client_handler
+
+    frames = [
+        proto.encode(b"hello"),
+        proto.encode(b"__ping__"),
+        proto.encode(b"x" * 5000, tag=b"F"),
+        proto.encode_mux(7, b"via gateway"),
+        proto.encode_mux(7, b"__ping__"),
+    ]
+    profiling.enable(str(tmp_path / "stacks.folded"))
+    capture = CaptureWriter(str(tmp_path / "cap.bin"))
+    server_sock, client_sock = socket.socketpair()
+    handler = threading.Thread(
+        target=client_handler, args=(Connection(server_sock, ("test", 0)), capture)
+    )
+    handler.start()
+    client_sock.settimeout(5)
+    for frame in frames:
+        client_sock.sendall(frame)
+    for _ in frames:
+        proto.recv_packet_tcp(client_sock)
+    client_sock.close()
+    handler.join(5)
+    profiler = profiling._active
+    profiling.shutdown()
+    capture.close()
+
+    # the client's own recv_packet_tcp calls add len(frames) receives
+    assert profiler.stage_count["receive"] == 2 * len(frames)
+    for stage in ("decode", "handle", "encode", "send"):
+        assert profiler.stage_count[stage] == len(frames), stage
+
+
+def test_span_totals_merge_live_and_exited_threads():
+    profiler = Profiler("/dev/null")
+
+    def work():
+        for _ in range(1000):
+            with profiler.span("encode"):
+                pass
+
+    workers = [threading.Thread(target=work) for _ in range(4)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    with profiler.span("send"):  # this thread stays alive
+        pass
+
+    count, seconds = profiler.totals()
+    assert count["encode"] == 4000 and count["send"] == 1
+    assert seconds["encode"] > 0
+    assert len(profiler._threads) == 1  # exited threads were folded in
@@ -0,0 +1,47 @@
+import socket
+import threading
+import tracemalloc
+
+from chat import proto
+
+
+def test_recv_packet_tcp_reassembles_split_frames():
+    a, b = socket.socketpair()
+    frames = [proto.encode(b"x" * n, tag=b"F") for n in (0, 1, 5, 300, 65535)]
+
+    def write():
+        for frame in frames:
+            for i in range(0, len(frame), 7):  # dribble in 7-byte pieces
+                a.sendall(frame[i:i + 7])
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    b.settimeout(5)
+    for frame in frames:
+        assert proto.recv_packet_tcp(b) == (b"F", frame[3:])
+    writer.join()
+    a.close()
+    b.close()
+
+
+def test_small_frame_does_not_allocate_a_full_size_buffer():
+    a, b = socket.socketpair()
+    pool = proto.BufferPool()  # empty pool
+    a.sendall(proto.encode(b"__ping__"))
+    tracemalloc.start()
+    assert proto.recv_packet_tcp(b, pool) == (b"T", b"__ping__")
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert peak < 4096
+    a.close()
+    b.close()
+
+
+def test_buffer_pool_size_classes():
+    pool = proto.BufferPool(min_size=256)
+    assert pool.size_class(1) == 256
+    assert pool.size_class(300) == 512
+    assert pool.size_class(65535) == 65536
+    buf = pool.acquire(300)
+    pool.release(buf)
+    assert pool.acquire(400) is buf
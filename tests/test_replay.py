@@ -0,0 +1,80 @@
+import socket
+import threading
+
+import pytest
+
+from chat import proto
+from chat.connection import Connection
+from chat.replay import replay
+from chat.tcp_server import client_handler
+
+
+@pytest.fixture
+def tcp_server():
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+
+    def serve():
+        while True:
+            try:
+                sock, addr = listener.accept()
+            except OSError:
+                return
+            threading.Thread(
+                target=client_handler, args=(Connection(sock, addr),), daemon=True
+            ).start()
+
+    threading.Thread(target=serve, daemon=True).start()
+    yield listener.getsockname()
+    listener.close()
+
+
+@pytest.fixture
+def lossy_udp_server():
+    """Echo datagrams back, except those whose body is b"drop"."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+
+    def serve():
+        while True:
+            try:
+                data, addr = sock.recvfrom(65535)
+            except OSError:
+                return
+            if proto.decode(data)[1] != b"drop":
+                sock.sendto(data, addr)
+
+    threading.Thread(target=serve, daemon=True).start()
+    yield sock.getsockname()
+    sock.close()
+
+
+def test_replay_against_tcp_server(tcp_server):
+    records = [
+        (10.00, 1, b"T", b"hello"),
+        (10.01, 2, b"T", b"__ping__"),
+        (10.02, 1, b"F", b"x" * 60000),
+        (10.03, 2, b"T", b"hello"),  # same body on another connection
+        (10.04, 1, b"T", b"bye"),
+    ]
+    report = replay(records, tcp_server, speed=None)
+    assert report["connections"] == 2
+    assert report["frames_sent"] == 5
+    assert report["replies"] == 5
+    assert report["lost"] == 0
+    assert report["send_errors"] == 0
+
+
+def test_replay_counts_lost_replies_and_send_errors(lossy_udp_server):
+    records = [
+        (1.0, 1, b"U", b"one"),
+        (1.1, 1, b"U", b"drop"),
+        (1.2, 1, b"U", b"x" * 65535),  # too large for one UDP datagram
+        (1.3, 1, b"U", b"two"),
+    ]
+    report = replay(records, lossy_udp_server, speed=None, udp=True, drain_timeout=0.3)
+    assert report["frames_sent"] == 3
+    assert report["send_errors"] == 1
+    assert report["replies"] == 2
+    assert report["lost"] == 1
@@ -0,0 +1,133 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from chat import proto
+from chat.connection import Connection
+from chat.scheduler import (
+    BULK, CONTROL, DEFAULT_WEIGHTS, INTERACTIVE, SendQueueFull, SendScheduler,
+)
+from chat.tcp_server import client_handler
+
+PING = b"__ping__"
+
+
+def test_pong_overtakes_bulk_backlog():
+    server_sock, client_sock = socket.socketpair()
+    conn = Connection(server_sock, ("test", 0), 1)
+    handler = threading.Thread(target=client_handler, args=(conn,), daemon=True)
+    handler.start()
+    client_sock.settimeout(5)
+
+    # 50 bulk frames, a ping, 50 more; the client reads slower than it
+    # sends, so a backlog (up to the byte bound) is queued at the server
+    bulk = proto.encode(b"x" * 60000, tag=b"F")
+
+    def send():
+        for i in range(101):
+            client_sock.sendall(proto.encode(PING) if i == 50 else bulk)
+
+    sender = threading.Thread(target=send, daemon=True)
+    sender.start()
+    time.sleep(0.5)
+
+    bodies = []
+    for _ in range(101):
+        bodies.append(proto.recv_packet_tcp(client_sock)[1])
+        time.sleep(0.002)
+    pong_index = bodies.index(PING)
+    assert pong_index <= 47, f"pong arrived after {pong_index} bulk echoes"
+
+    sender.join(5)
+    client_sock.close()
+    handler.join(5)
+
+
+def test_non_reading_client_is_held_back_by_byte_bound():
+    server_sock, client_sock = socket.socketpair()
+    conn = Connection(server_sock, ("test", 0), 1)
+    handler = threading.Thread(target=client_handler, args=(conn,), daemon=True)
+    handler.start()
+
+    bulk = proto.encode(b"x" * 60000, tag=b"F")
+    client_sock.settimeout(1)
+    sent = 0
+    try:
+        for _ in range(600):
+            client_sock.sendall(bulk)
+            sent += 1
+    except socket.timeout:
+        pass  # the server stopped reading
+
+    assert sent < 600, "the server kept reading from a client that never reads"
+    assert conn.out.pending_bytes() <= conn.out.max_pending_bytes
+    # a ping is still let through past the bound
+    conn.out.submit(proto.encode(PING), CONTROL, block=False)
+
+    client_sock.close()
+    handler.join(5)
+
+
+def test_writer_mode_orders_queued_frames():
+    a, b = socket.socketpair()
+    out = SendScheduler(a, writer=True)
+    # pretend a writer is busy so everything is queued, then start it
+    with out._lock:
+        out._draining = True
+    out.submit(proto.encode(b"bulk", tag=b"F"), BULK)
+    out.submit(proto.encode(b"chat"), INTERACTIVE)
+    out.submit(proto.encode(PING), CONTROL)
+    out.submit(proto.encode(b"chat2"), INTERACTIVE)
+    threading.Thread(target=out._write_loop, daemon=True).start()
+
+    b.settimeout(5)
+    bodies = [proto.recv_packet_tcp(b)[1] for _ in range(4)]
+    assert bodies[0] == PING
+    assert sorted(bodies[1:]) == [b"bulk", b"chat", b"chat2"]
+    a.close()
+    b.close()
+
+
+def test_bounded_queue_raises_when_full_but_admits_control():
+    a, b = socket.socketpair()
+    frame = proto.encode(b"x" * 97)  # 100 bytes
+    out = SendScheduler(a, writer=True, max_pending_bytes=250)
+    with out._lock:
+        out._draining = True  # keep the writer from starting
+    out.submit(frame)
+    out.submit(frame)
+    with pytest.raises(SendQueueFull):
+        out.submit(frame, block=False)
+    out.submit(proto.encode(PING), CONTROL)
+    assert out.pending() == 3
+    assert out.pending_bytes() == 200
+    a.close()
+    b.close()
+
+
+def test_weights_are_copied_per_scheduler():
+    a, b = socket.socketpair()
+    out = SendScheduler(a)
+    out.weights[BULK] = 100
+    assert DEFAULT_WEIGHTS[BULK] != 100
+    assert SendScheduler(b).weights[BULK] == DEFAULT_WEIGHTS[BULK]
+    a.close()
+    b.close()
+
+
+def test_replies_on_idle_connection_start_no_writer_thread():
+    server_sock, client_sock = socket.socketpair()
+    conn = Connection(server_sock, ("test", 0), 1)
+    handler = threading.Thread(target=client_handler, args=(conn,), daemon=True)
+    handler.start()
+    client_sock.settimeout(5)
+
+    for body in (PING, b"hello", PING):
+        client_sock.sendall(proto.encode(body))
+        assert proto.recv_packet_tcp(client_sock)[1] == body
+        assert not any(t.name == "writer" for t in threading.enumerate())
+
+    client_sock.close()
+    handler.join(5)